@@ -1,15 +1,153 @@
 import chess
 import chess.pgn
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional, List, Tuple
+from typing import Dict, FrozenSet, Iterator, Optional, List, Tuple
+
+def _slider_attacks(piece_type: int, square: int, occupied: int) -> int:
+    """Squares attacked by a bishop, rook or queen on square for the given occupancy"""
+    attacks = 0
+    if piece_type in (chess.BISHOP, chess.QUEEN):
+        attacks = chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied]
+    if piece_type in (chess.ROOK, chess.QUEEN):
+        attacks |= (chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] |
+                    chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied])
+    return attacks
+
+def legal_moves_san(board: chess.Board) -> List[str]:
+    """
+    Get SAN for every legal move in one pass over the move generator
+    
+    board.san() rescans the legal moves of the same piece type for each move
+    to disambiguate it, and pushes every move to test for check. Here the
+    competing origin squares are collected once per (piece, target) pair,
+    checks are read off the attack tables, and only checking moves are
+    pushed to test for mate.
+    
+    Args:
+        board: Position to generate moves for
+        
+    Returns:
+        List[str]: Legal moves in SAN format, in legal move generator order
+    """
+    moves = list(board.legal_moves)
+    us = board.occupied_co[board.turn]
+    occupied = board.occupied
+    king = board.king(not board.turn)
+    king_bb = chess.BB_SQUARES[king] if king is not None else 0
+    
+    # Our pieces that are the only blocker between one of our sliders and
+    # their king: moving one off that line gives a discovered check
+    discoverers = 0
+    if king is not None:
+        rooks_and_queens = (board.rooks | board.queens) & us
+        bishops_and_queens = (board.bishops | board.queens) & us
+        snipers = ((chess.BB_RANK_ATTACKS[king][0] & rooks_and_queens) |
+                   (chess.BB_FILE_ATTACKS[king][0] & rooks_and_queens) |
+                   (chess.BB_DIAG_ATTACKS[king][0] & bishops_and_queens))
+        for sniper in chess.scan_forward(snipers):
+            blockers = chess.between(king, sniper) & occupied
+            if blockers & us and chess.popcount(blockers) == 1:
+                discoverers |= blockers
+    
+    # Origin squares of the pieces of each type that can reach each square
+    origins: Dict[Tuple[int, int], int] = {}
+    for move in moves:
+        key = (board.piece_type_at(move.from_square), move.to_square)
+        origins[key] = origins.get(key, 0) | chess.BB_SQUARES[move.from_square]
+    
+    sans = []
+    for move in moves:
+        if board.is_castling(move):
+            sans.append(board.san(move))
+            continue
+        
+        piece_type = board.piece_type_at(move.from_square)
+        capture = board.is_capture(move)
+        
+        if piece_type == chess.PAWN:
+            san = chess.FILE_NAMES[chess.square_file(move.from_square)] if capture else ""
+        else:
+            san = chess.piece_symbol(piece_type).upper()
+            if piece_type != chess.KING:
+                others = origins[(piece_type, move.to_square)] & ~chess.BB_SQUARES[move.from_square]
+                if others:
+                    row, column = False, False
+                    if others & chess.BB_RANKS[chess.square_rank(move.from_square)]:
+                        column = True
+                    if others & chess.BB_FILES[chess.square_file(move.from_square)]:
+                        row = True
+                    else:
+                        column = True
+                    if column:
+                        san += chess.FILE_NAMES[chess.square_file(move.from_square)]
+                    if row:
+                        san += chess.RANK_NAMES[chess.square_rank(move.from_square)]
+        
+        if capture:
+            san += "x"
+        san += chess.SQUARE_NAMES[move.to_square]
+        if move.promotion:
+            san += "=" + chess.piece_symbol(move.promotion).upper()
+        
+        # Check detection without pushing the move
+        if board.is_en_passant(move):
+            check = board.gives_check(move)
+        else:
+            attacker = move.promotion or piece_type
+            if attacker == chess.PAWN:
+                check = bool(chess.BB_PAWN_ATTACKS[board.turn][move.to_square] & king_bb)
+            elif attacker == chess.KNIGHT:
+                check = bool(chess.BB_KNIGHT_ATTACKS[move.to_square] & king_bb)
+            elif attacker == chess.KING:
+                check = False
+            else:
+                after = (occupied & ~chess.BB_SQUARES[move.from_square]) | chess.BB_SQUARES[move.to_square]
+                check = bool(_slider_attacks(attacker, move.to_square, after) & king_bb)
+            if (not check and discoverers & chess.BB_SQUARES[move.from_square]
+                    and not chess.ray(king, move.from_square) & chess.BB_SQUARES[move.to_square]):
+                check = True
+        
+        if check:
+            board.push(move)
+            mate = board.is_checkmate()
+            board.pop()
+            san += "#" if mate else "+"
+        
+        sans.append(san)
+    
+    return sans
+
+@dataclass
+class MoveHistory:
+    """Moves played in a game, stored as parallel columns indexed by ply"""
+    ucis: List[str] = field(default_factory=list)
+    sans: List[str] = field(default_factory=list)
+    comments: List[str] = field(default_factory=list)
+    
+    def __len__(self) -> int:
+        return len(self.sans)
+    
+    def __iter__(self) -> Iterator[Tuple[str, str, str]]:
+        """Iterate over (move, move_san, explanation) rows"""
+        return zip(self.ucis, self.sans, self.comments)
+    
+    def append(self, uci: str, san: str, comment: str):
+        """Record a move played"""
+        self.ucis.append(uci)
+        self.sans.append(san)
+        self.comments.append(comment)
+    
+    def copy(self) -> "MoveHistory":
+        """Copy the columns, so the copy doesn't see later moves"""
+        return MoveHistory(self.ucis.copy(), self.sans.copy(), self.comments.copy())
 
 @dataclass
 class GameState:
     """Represents the current state of a chess game"""
     board: chess.Board
     current_player: str
-    move_history: List[Tuple[str, str, str]]  # List of (move, move_san, explanation) tuples
+    move_history: MoveHistory
     game_result: Optional[str] = None
     start_time: datetime = datetime.now()
 
@@ -21,32 +159,66 @@ class ChessGame:
         self.board = chess.Board()
         self.player1 = player1
         self.player2 = player2
-        self.move_history: List[Tuple[str, str, str]] = []
+        self._players = (player2, player1)  # Indexed by board.turn, chess.BLACK is 0
+        self.move_history = MoveHistory()
         self.start_time = datetime.now()
+        self._legal_san_cache: Optional[List[str]] = None
+        self._legal_san_set_cache: Optional[FrozenSet[str]] = None
+        self._fen_cache: Optional[str] = None
+        self._status_cache: Optional[Tuple[bool, str]] = None
+        
+        # PGN tree grown one node per move so exports don't replay the game
+        self._pgn_root = chess.pgn.Game()
+        self._pgn_tail: chess.pgn.GameNode = self._pgn_root
+        self._pgn_root.headers["Event"] = "LLM Chess Battle"
+        self._pgn_root.headers["Date"] = self.start_time.strftime("%Y.%m.%d")
+        self._pgn_root.headers["White"] = self.player1
+        self._pgn_root.headers["Black"] = self.player2
         
     @property
     def current_player(self) -> str:
         """Get the current player's name"""
-        return self.player1 if self.board.turn == chess.WHITE else self.player2
+        return self._players[self.board.turn]
     
     @property
     def is_game_over(self) -> bool:
         """Check if the game is over"""
-        return self.board.is_game_over()
+        return self.game_status()[0]
     
     @property
     def result(self) -> str:
         """Get the game result"""
-        if not self.is_game_over:
-            return "*"
-        if self.board.is_checkmate():
-            return "1-0" if self.board.turn == chess.BLACK else "0-1"
-        return "1/2-1/2"
+        return self.game_status()[1]
+    
+    def game_status(self) -> Tuple[bool, str]:
+        """
+        Get whether the game is over and its result, cached until the next move
+        
+        Returns:
+            Tuple[bool, str]: (game over, result) where result is "*" while the game is running
+        """
+        if self._status_cache is None:
+            # Only automatic endings, draws that have to be claimed don't end the game
+            outcome = self.board.outcome(claim_draw=False)
+            self._status_cache = (outcome is not None, outcome.result() if outcome else "*")
+        return self._status_cache
     
     def get_legal_moves(self) -> List[str]:
         """Get list of legal moves in UCI format"""
         return [move.uci() for move in self.board.legal_moves]
     
+    def get_legal_san(self) -> List[str]:
+        """Get list of legal moves in SAN format, cached until the next move"""
+        if self._legal_san_cache is None:
+            self._legal_san_cache = legal_moves_san(self.board)
+        return self._legal_san_cache
+    
+    def get_legal_san_set(self) -> FrozenSet[str]:
+        """Get legal moves in SAN format as a set for membership checks"""
+        if self._legal_san_set_cache is None:
+            self._legal_san_set_cache = frozenset(self.get_legal_san())
+        return self._legal_san_set_cache
+    
     def make_move(self, move_uci: str, move_san: str, explanation: str = "") -> bool:
         """
         Make a move on the board
@@ -61,69 +233,90 @@ class ChessGame:
         """
         try:
             move = chess.Move.from_uci(move_uci)
-            if move in self.board.legal_moves:
-                self.board.push(move)
-                self.move_history.append((move_uci, move_san, explanation))
-                return True
-            return False
         except ValueError:
             return False
+        return self.make_move_obj(move, move_san, explanation)
+    
+    def make_move_obj(self, move: chess.Move, move_san: str, explanation: str = "") -> bool:
+        """
+        Make an already parsed move on the board
+        
+        Args:
+            move: Move to play, e.g. from board.parse_san
+            move_san: Move in SAN format (e.g., "e4")
+            explanation: Optional explanation of the move
+            
+        Returns:
+            bool: True if move was successful
+        """
+        if not self.board.is_legal(move):
+            return False
+        self.board.push(move)
+        self._legal_san_cache = None
+        self._legal_san_set_cache = None
+        self._fen_cache = None
+        self._status_cache = None
+        self.move_history.append(move.uci(), move_san, explanation)
+        self._pgn_tail = self._pgn_tail.add_variation(move)
+        if explanation:
+            self._pgn_tail.comment = explanation
+        return True
     
-    def get_state(self) -> GameState:
-        """Get current game state"""
+    def get_state(self, copy: bool = False) -> GameState:
+        """
+        Get current game state
+        
+        Args:
+            copy: Snapshot the board and move history. When False the returned
+                state shares them with the game and must be treated as read-only.
+                
+        Returns:
+            GameState: Current state of the game
+        """
         return GameState(
-            board=self.board.copy(),
+            board=self.board.copy(stack=False) if copy else self.board,
             current_player=self.current_player,
-            move_history=self.move_history.copy(),
+            move_history=self.move_history.copy() if copy else self.move_history,
             game_result=self.result if self.is_game_over else None,
             start_time=self.start_time
         )
     
     def get_fen(self) -> str:
         """Get current position in FEN notation"""
-        return self.board.fen()
+        if self._fen_cache is None:
+            self._fen_cache = self.board.fen()
+        return self._fen_cache
     
     def export_pgn(self) -> str:
         """Export game in PGN format"""
-        game = chess.pgn.Game()
-        
-        # Set headers
-        game.headers["Event"] = "LLM Chess Battle"
-        game.headers["Date"] = self.start_time.strftime("%Y.%m.%d")
-        game.headers["White"] = self.player1
-        game.headers["Black"] = self.player2
-        game.headers["Result"] = self.result
-        
-        # Add moves
-        node = game
-        for move_uci, move_san, explanation in self.move_history:
-            move = chess.Move.from_uci(move_uci)
-            node = node.add_variation(move)
-            if explanation:
-                node.comment = explanation
-        
-        return str(game)
+        # Moves and the fixed headers are already in the tree, only the result changes
+        self._pgn_root.headers["Result"] = self.result
+        return str(self._pgn_root)
     
-    def get_position_analysis(self) -> dict:
-        """Get basic analysis of the current position"""
-        return {
+    def get_position_analysis(self, include_repetition: bool = False) -> dict:
+        """
+        Get basic analysis of the current position
+        
+        Args:
+            include_repetition: Also report "is_repetition". This replays the
+                move stack, so it is left out unless asked for.
+                
+        Returns:
+            dict: Position flags and piece counts
+        """
+        analysis = {
             "in_check": self.board.is_check(),
             "in_checkmate": self.board.is_checkmate(),
             "in_stalemate": self.board.is_stalemate(),
             "is_insufficient_material": self.board.is_insufficient_material(),
             "is_fifty_moves": self.board.is_fifty_moves(),
-            "is_repetition": self.board.is_repetition(),
             "fullmove_number": self.board.fullmove_number,
             "piece_count": {
-                "white": len(self.board.pieces(chess.PAWN, chess.WHITE)) +
-                        len(self.board.pieces(chess.KNIGHT, chess.WHITE)) +
-                        len(self.board.pieces(chess.BISHOP, chess.WHITE)) +
-                        len(self.board.pieces(chess.ROOK, chess.WHITE)) +
-                        len(self.board.pieces(chess.QUEEN, chess.WHITE)),
-                "black": len(self.board.pieces(chess.PAWN, chess.BLACK)) +
-                        len(self.board.pieces(chess.KNIGHT, chess.BLACK)) +
-                        len(self.board.pieces(chess.BISHOP, chess.BLACK)) +
-                        len(self.board.pieces(chess.ROOK, chess.BLACK)) +
-                        len(self.board.pieces(chess.QUEEN, chess.BLACK))
+                # Non-king pieces, counted straight from the occupancy bitboards
+                "white": chess.popcount(self.board.occupied_co[chess.WHITE] & ~self.board.kings),
+                "black": chess.popcount(self.board.occupied_co[chess.BLACK] & ~self.board.kings)
             }
         }
+        if include_repetition:
+            analysis["is_repetition"] = self.board.is_repetition()
+        return analysis
@@ -5,7 +5,9 @@ from pathlib import Path
 project_root = str(Path(__file__).parent.parent.parent)
 sys.path.append(project_root)
 
-from src.chess_engine.game import ChessGame
+import chess
+
+from src.chess_engine.game import ChessGame, legal_moves_san
 
 def test_chess_game():
     """Test basic chess game functionality"""
@@ -19,13 +21,24 @@ def test_chess_game():
     assert game.result == "*"
     assert game.current_player == "Player1"
     assert game.get_fen().startswith("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR")
+    assert len(game.get_legal_san()) == 20
+    assert "Nf3" in game.get_legal_san()
     print("Initial state OK!")
     
     # Test making moves
     print("\nTesting moves...")
     assert game.make_move("e2e4", "e4", "King's pawn opening")
     assert game.make_move("e7e5", "e5", "King's pawn response")
+    assert not game.make_move("e4e5", "e5")
+    assert not game.make_move("not-a-move", "")
+    assert not game.make_move_obj(chess.Move.from_uci("e2e4"), "e4")
     assert len(game.move_history) == 2
+    assert game.move_history.sans == ["e4", "e5"]
+    assert list(game.move_history)[0] == ("e2e4", "e4", "King's pawn opening")
+    assert game.current_player == "Player1"
+    assert "Bc4" in game.get_legal_san()
+    assert game.get_legal_san_set() == frozenset(game.get_legal_san())
+    assert game.get_fen().startswith("rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR")
     print("Moves OK!")
     
     # Test position analysis
@@ -34,16 +47,54 @@ def test_chess_game():
     assert not analysis["in_check"]
     assert not analysis["in_checkmate"]
     assert analysis["piece_count"]["white"] == analysis["piece_count"]["black"]
+    assert analysis["piece_count"]["white"] == 15
+    assert "is_repetition" not in analysis
+    assert not game.get_position_analysis(include_repetition=True)["is_repetition"]
     print("Position analysis OK!")
     
+    # Test state snapshots
+    print("\nTesting game state...")
+    assert game.get_state().board is game.board
+    snapshot = game.get_state(copy=True)
+    assert snapshot.board is not game.board
+    assert snapshot.board.fen() == game.get_fen()
+    assert len(snapshot.move_history) == 2
+    assert snapshot.move_history is not game.move_history
+    print("Game state OK!")
+    
     # Test PGN export
     print("\nTesting PGN export...")
     pgn = game.export_pgn()
     assert "1. e4" in pgn
     assert "1... e5" in pgn
     assert "King's pawn opening" in pgn
+    assert '[White "Player1"]' in pgn
+    assert game.make_move("g1f3", "Nf3")
+    assert "2. Nf3" in game.export_pgn()
     print("PGN export OK!")
     
+    # Test batched SAN generation against python-chess
+    print("\nTesting SAN generation...")
+    for fen in [
+        "N3N3/8/8/8/N3N2k/8/8/K7 w - - 0 1",  # knights needing file, rank and square
+        "1k6/1P6/8/8/8/8/8/K7 w - - 0 1",  # promotions
+        "k7/8/8/KPp4r/8/8/8/8 w - c6 0 2",  # en passant into discovered check
+        "4k3/8/8/8/8/8/4B3/4R1K1 w - - 0 1",  # discovered checks
+        "5k2/8/8/8/8/8/8/R3K2R w KQ - 0 1",  # castling with check
+    ]:
+        board = chess.Board(fen)
+        assert legal_moves_san(board) == [board.san(move) for move in board.legal_moves]
+    print("SAN generation OK!")
+    
+    # Test game termination
+    print("\nTesting game termination...")
+    mate = ChessGame("Player1", "Player2")
+    for uci in ["f2f3", "e7e5", "g2g4", "d8h4"]:
+        assert mate.make_move(uci, "")
+    assert mate.game_status() == (True, "0-1")
+    assert mate.is_game_over and mate.result == "0-1"
+    print("Game termination OK!")
+    
     print("\nAll tests passed successfully!")
 
 if __name__ == "__main__":
@@ -1,9 +1,13 @@
 import asyncio
+import logging
+from dataclasses import replace
 from datetime import datetime
 from typing import Optional, Dict, Any
 from src.chess_engine.game import ChessGame
 from src.llm.base import BaseLLM, ChessMove
 
+log = logging.getLogger(__name__)
+
 class GameController:
     """Controls a chess match between two LLMs"""
     
@@ -16,6 +20,8 @@ class GameController:
     ):
         self.white_player = white_player
         self.black_player = black_player
+        self._players = (black_player, white_player)  # Indexed by board.turn
+        self._background_tasks = set()
         self.time_control = time_control
         self.max_moves = max_moves
         
@@ -35,9 +41,12 @@ class GameController:
             "white": [],
             "black": []
         }
+        self._time_sum = {"white": 0.0, "black": 0.0}
         
         self.start_time = None
+        self._finished = False
         self.game_stats = {
+            "result": "*",
             "total_moves": 0,
             "average_time_per_move": {"white": 0.0, "black": 0.0},
             "longest_think_time": {"white": 0.0, "black": 0.0}
@@ -58,6 +67,9 @@ class GameController:
                 current_player = self._get_current_player()
                 color = "white" if self.game.board.turn else "black"
                 
+                # Warm the waiting player's connection while this move is generated
+                self._prewarm(self._players[not self.game.board.turn])
+                
                 # Get and validate move
                 move = await self._get_next_move(current_player, color)
                 if not move:
@@ -69,12 +81,12 @@ class GameController:
                 # Update statistics
                 self._update_stats(move, color)
                 
-            return self.export_game()
+            return await self.export_game_async()
             
         except Exception as e:
             # Log the error and end the game
             self.game_stats["termination"] = f"Error: {str(e)}"
-            return self.export_game()
+            return await self.export_game_async()
 
     async def _get_next_move(self, player: BaseLLM, color: str) -> Optional[bool]:
         """Get and validate the next move from an LLM"""
@@ -84,14 +96,18 @@ class GameController:
                 self.time_remaining[color] if self.time_remaining else None
             )
 
-            legal_moves = [self.game.board.san(move) for move in self.game.board.legal_moves]
+            board_fen = self.game.get_fen()
             
-            # Get move from LLM
-            move_result = await player.get_next_move(
-                board_fen=self.game.get_fen(),
-                move_history=[move for _, move, _ in self.game.move_history], 
-                legal_moves=legal_moves
-            )
+            # Get move from LLM, unless it caches replies and has seen this position
+            move_result = player.cached_reply(board_fen)
+            from_cache = move_result is not None
+            if not from_cache:
+                move_result = await player.get_next_move(
+                    board_fen=board_fen,
+                    move_history=self.game.move_history.sans,
+                    legal_moves=self.game.get_legal_san(),
+                    legal_set=self.game.get_legal_san_set()
+                )
             
             # Update time remaining if using time control
             if self.time_remaining:
@@ -100,43 +116,61 @@ class GameController:
                     self.game_stats["termination"] = f"{color} lost on time"
                     return None
                 
-            # Convert algebraic notation to UCI format
+            # Parse the algebraic notation once and play the parsed move directly
             try:
                 san_move = move_result.move
-                uci_move = self.game.board.parse_san(san_move).uci()
-                move_result.move = uci_move
+                move_obj = self.game.board.parse_san(san_move)
+                move_result.move = move_obj.uci()
             except ValueError:
-                print(f"Invalid move format from {color} player: {move_result.move}")
+                log.warning("Invalid move format from %s player: %s", color, move_result.move)
                 return None
             
             # Make the move
-            success = self.game.make_move(
-                move_result.move,
+            success = self.game.make_move_obj(
+                move_obj,
                 san_move,
                 f"{move_result.explanation} (confidence: {move_result.confidence:.2f})"
             )
             
+            # Only remember moves that were played, an illegal one would forfeit every later game
+            if success and not from_cache:
+                player.cache_reply(board_fen, replace(move_result, move=san_move))
+            
             return move_result if success else success
             
         except Exception as e:
-            print(f"Error getting move from {color} player: {str(e)}")
+            log.error("Error getting move from %s player: %s", color, e)
             return None
 
+    def _prewarm(self, player: BaseLLM):
+        """Prewarm a player's API connection in the background"""
+        task = asyncio.create_task(player.prewarm())
+        # Hold a reference until the task finishes so it isn't garbage collected
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
     def _get_current_player(self) -> BaseLLM:
         """Get the current player based on board state"""
-        return self.white_player if self.game.board.turn else self.black_player
+        return self._players[self.game.board.turn]
 
     def _is_game_finished(self) -> bool:
         """Check if the game is finished"""
+        # Once finished, keep the recorded termination instead of re-evaluating it
+        if self._finished:
+            return True
+        
         # Check normal chess endings
-        if self.game.is_game_over:
+        game_over, result = self.game.game_status()
+        if game_over:
             self.game_stats["termination"] = "Normal chess ending"
-            self.game_stats["result"] = self.game.result()
+            self.game_stats["result"] = result
+            self._finished = True
             return True
             
         # Check max moves
         if self.max_moves and self.game_stats["total_moves"] >= self.max_moves:
             self.game_stats["termination"] = "Maximum moves reached"
+            self._finished = True
             return True
             
         return False
@@ -145,19 +179,29 @@ class GameController:
         """Update game statistics after a move"""
         self.game_stats["total_moves"] += 1
         self.move_times[color].append(move.thinking_time)
+        self._time_sum[color] += move.thinking_time
         
-        # Update average time
+        # Update average time from the running sum
         self.game_stats["average_time_per_move"][color] = (
-            sum(self.move_times[color]) / len(self.move_times[color])
+            self._time_sum[color] / len(self.move_times[color])
         )
         
         # Update longest think time
         if move.thinking_time > self.game_stats["longest_think_time"][color]:
             self.game_stats["longest_think_time"][color] = move.thinking_time
 
+    async def export_game_async(self) -> str:
+        """
+        Export the game from a worker thread
+        
+        Formatting the PGN of a long game takes milliseconds of pure Python,
+        which would otherwise stall every other game and request on the loop.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.export_game)
+
     def export_game(self) -> str:
         """Export the game with metadata"""
-        print("Exporting game")
+        log.debug("Exporting game")
         pgn = self.game.export_pgn()
         
         # Add game statistics as comments
@@ -176,5 +220,5 @@ class GameController:
         if self.game_stats["result"] != "*":
             stats_comment += f"Result: {self.game_stats['result']}\n"
 
-        print("stats_comment", stats_comment)
+        log.info("Game statistics:\n%s", stats_comment)
         return f"{pgn}\n\n{stats_comment}"
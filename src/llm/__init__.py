@@ -3,7 +3,15 @@ LLM interface implementations for different AI models.
 """
 
 from .base import BaseLLM, ChessMove
-from .openai_llm import OpenAILLM
-from .anthropic_llm import AnthropicLLM
+
+def __getattr__(name):
+    # Each provider module imports its SDK, so only load the one that is used
+    if name == 'OpenAILLM':
+        from .openai_llm import OpenAILLM
+        return OpenAILLM
+    if name == 'AnthropicLLM':
+        from .anthropic_llm import AnthropicLLM
+        return AnthropicLLM
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = ['BaseLLM', 'ChessMove', 'OpenAILLM', 'AnthropicLLM'] 
\ No newline at end of file
@@ -1,60 +1,125 @@
 import json
+import logging
 from typing import Optional
-from anthropic import Anthropic
+import anthropic
+from anthropic import AsyncAnthropic
 import time
-from src.llm.base import BaseLLM, ChessMove
+import weakref
+from src.llm.base import BaseLLM, ChessMove, HTTP2_AVAILABLE, for_running_loop
+
+log = logging.getLogger(__name__)
+
+# HTTP client of each event loop, shared by every AnthropicLLM so keep-alive
+# connections and their TLS sessions are reused across players and games
+_HTTP_CLIENTS: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
 
 class AnthropicLLM(BaseLLM):
     """Anthropic Claude implementation of the LLM interface"""
     
     def __init__(self, api_key: str, model: str = "claude-3-opus-20240229", temperature: float = 0.7):
         super().__init__(api_key, temperature)
-        self.client = Anthropic(api_key=api_key)
         self.model = model
+        self._clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self) -> AsyncAnthropic:
+        """API client of the running event loop, as pooled connections can't move between loops"""
+        http_client = for_running_loop(
+            _HTTP_CLIENTS, lambda: anthropic.DefaultAsyncHttpxClient(http2=HTTP2_AVAILABLE)
+        )
+        return for_running_loop(
+            self._clients,
+            # Retries are handled by get_next_move
+            lambda: AsyncAnthropic(api_key=self.api_key, http_client=http_client, max_retries=0)
+        )
+
+    async def _warm_connection(self):
+        """List models, a request that costs no tokens, to open a pooled connection"""
+        await self.client.models.list()
+
+    @staticmethod
+    def _history_content(history_blocks: tuple[str, ...]) -> list[dict]:
+        """
+        Text blocks of the task and move history, with the cache breakpoint on the last
+        
+        Earlier blocks are sent unchanged from request to request and the moves
+        played since are added as new blocks, so the prefix cached by the previous
+        request is found in the blocks just before the breakpoint.
+        """
+        content = [{"type": "text", "text": block} for block in history_blocks]
+        content[-1]["cache_control"] = {"type": "ephemeral"}
+        return content
 
     async def get_next_move(self, 
                            board_fen: str, 
                            move_history: list[str],
-                           legal_moves: list[str]) -> ChessMove:
+                           legal_moves: list[str],
+                           legal_set: Optional[frozenset[str]] = None) -> ChessMove:
         """Get next move using Anthropic's API"""
-        print("Calling Anthropic API")
-        self._rate_limit()
+        log.debug("Calling Anthropic API")
         
-        prompt = self._get_chess_prompt(board_fen, move_history, legal_moves)
+        history_blocks, position_block = self._get_chess_prompt_blocks(board_fen, move_history, legal_moves)
+        if legal_set is None:
+            legal_set = frozenset(legal_moves)
+        rejected_moves: list[str] = []
         start_time = time.time()
 
         for i in range(1, self.retries + 1):
         
             try:
-                response = self.client.messages.create(
-                    model=self.model,
-                    max_tokens=1000,
-                    temperature=self.temperature,
-                    system="You are a skilled chess engine. Respond only with JSON.",
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ]
-                )
+                async with self._semaphore:
+                    await self._rate_limit()
+                    async with self.client.messages.stream(
+                        model=self.model,
+                        max_tokens=1000,
+                        temperature=self.temperature,
+                        # Mark the static instructions and the move history as cacheable
+                        # prefixes, only the position block changes between requests
+                        system=[
+                            {"type": "text", "text": self.system_prompt, "cache_control": {"type": "ephemeral"}}
+                        ],
+                        messages=[
+                            {"role": "user", "content": self._history_content(history_blocks) + [
+                                {"type": "text", "text": position_block}
+                            ]}
+                        ]
+                    ) as stream:
+                        text, illegal_move = await self._read_stream(
+                            stream.text_stream, legal_set, stop_on_illegal=i < self.retries
+                        )
+            except (anthropic.APIConnectionError, anthropic.APIStatusError) as e:
+                # Transient failures, overloaded servers included, are worth waiting out
+                if i < self.retries and self._is_transient(e):
+                    log.warning("Transient error from Anthropic API: %s, backing off...", e)
+                    await self._backoff(i)
+                    continue
+                log.error("Error calling Anthropic API: %s", e)
+                raise Exception(f"Error calling Anthropic API: {str(e)}")
+            except Exception as e:
+                log.error("Error calling Anthropic API: %s", e)
+                raise Exception(f"Error calling Anthropic API: {str(e)}")
 
-                
-                thinking_time = time.time() - start_time
-                
-                try:
-                    result = json.loads(response.content[0].text)
-                    if result["move"] not in legal_moves and i < self.retries:
-                        print(f"Move {result['move']} not in legal moves {legal_moves}, retrying...")
-                        continue
-                    print("Returning move from Anthropic, ", result["move"])
-                    return ChessMove(
-                        move=result["move"],
-                        explanation=result["explanation"],
-                        confidence=float(result["confidence"]),
-                        thinking_time=thinking_time
+            thinking_time = time.time() - start_time
+            
+            try:
+                # An empty move is illegal too, so test for None rather than truthiness
+                result = None if illegal_move is not None else self._parse_json(text)
+                move = illegal_move if illegal_move is not None else result["move"]
+                if move not in legal_set and i < self.retries:
+                    # Ask again straight away, telling the model which move was rejected
+                    log.info("Move %s not in legal moves %s, retrying...", move, legal_moves)
+                    rejected_moves.append(move)
+                    history_blocks, position_block = self._get_chess_prompt_blocks(
+                        board_fen, move_history, legal_moves, rejected_moves
                     )
-                except (json.JSONDecodeError, KeyError) as e:
-                    print(f"Invalid response format from Anthropic: {e}")
-                    raise ValueError(f"Invalid response format from Anthropic: {e}")
-                    
-            except Exception as e:
-                print(f"Error calling Anthropic API: {str(e)}")
-                raise Exception(f"Error calling Anthropic API: {str(e)}") 
\ No newline at end of file
+                    continue
+                log.debug("Returning move from Anthropic: %s", result["move"])
+                return ChessMove(
+                    move=result["move"],
+                    explanation=result["explanation"],
+                    confidence=float(result["confidence"]),
+                    thinking_time=thinking_time
+                )
+            except (json.JSONDecodeError, KeyError) as e:
+                log.error("Invalid response format from Anthropic: %s", e)
+                raise ValueError(f"Invalid response format from Anthropic: {e}")
@@ -1,7 +1,50 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator, Callable, Tuple, TypeVar
+import asyncio
+import importlib.util
+import json
+import logging
+import random
+import re
 import time
-from dataclasses import dataclass
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard library parser is the fallback
+    orjson = None
+
+# HTTP/2 lets concurrent requests share one connection, but needs the optional h2 package
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Completed "move" field in a partially streamed JSON response
+_MOVE_FIELD = re.compile(r'"move"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+def for_running_loop(values: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, T]",
+                     factory: Callable[[], T]) -> T:
+    """
+    Get the value kept in values for the running event loop, made by factory on first use in it
+    
+    asyncio primitives and pooled connections only work in the loop they were first
+    used in, so anything long lived that holds them is kept per loop. Entries of
+    closed loops are dropped.
+    """
+    loop = asyncio.get_running_loop()
+    for closed in [other for other in values if other.is_closed()]:
+        del values[closed]
+    if loop not in values:
+        values[loop] = factory()
+    return values[loop]
+
+def _position_key(board_fen: str) -> str:
+    """FEN without the halfmove clock and move number, which don't change the legal moves"""
+    return board_fen.rsplit(" ", 2)[0]
 
 @dataclass
 class ChessMove:
@@ -14,26 +57,152 @@ class ChessMove:
 class BaseLLM(ABC):
     """Abstract base class for LLM interactions"""
     
-    def __init__(self, api_key: str, temperature: float = 0.7):
+    # Static instructions, sent as the system prompt so providers can cache them
+    system_prompt = (
+        "You are a skilled chess engine. Respond only with JSON.\n"
+        "Respond with your move in algebraic notation (e.g., 'e4', 'Nf3', etc.) "
+        "and a brief explanation of your thinking.\n"
+        "Format your response as JSON with keys: 'move', 'explanation', 'confidence' (0-1)"
+    )
+    
+    def __init__(self, api_key: str, temperature: float = 0.7, max_concurrency: int = 4):
         self.api_key = api_key
         self.temperature = temperature
         self.last_call_time = 0
-        self.min_delay = 1.0  # Minimum delay between API calls in seconds
+        self.min_delay = 1.0  # Average delay between API calls in seconds
+        self.burst = 3  # API calls allowed back-to-back before min_delay applies
         self.retries = 3
+        self.keepalive = 5.0  # Seconds an idle pooled connection stays open
+        self._last_warm = 0.0
+        self.reply_cache_size = 0  # Positions whose chosen moves are replayed, 0 disables
+        self._reply_cache: OrderedDict[str, ChessMove] = OrderedDict()
+        self._tokens = float(self.burst)
+        self.max_concurrency = max_concurrency
+        self._loop_limits: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        
+        # Rendered "Previous moves" lines, one chunk per batch of moves added as the game goes on
+        self._history_moves: list[str] = []
+        self._history_chunks: list[str] = []
+
+    def _limits(self) -> Tuple[asyncio.Lock, asyncio.Semaphore]:
+        """Rate limit lock and API call semaphore of the running event loop, made on first use in it"""
+        return for_running_loop(
+            self._loop_limits, lambda: (asyncio.Lock(), asyncio.Semaphore(self.max_concurrency))
+        )
+
+    @property
+    def _rate_lock(self) -> asyncio.Lock:
+        return self._limits()[0]
+
+    @property
+    def _semaphore(self) -> asyncio.Semaphore:
+        return self._limits()[1]
 
-    def _rate_limit(self):
-        """Implement basic rate limiting"""
-        current_time = time.time()
-        time_since_last_call = current_time - self.last_call_time
-        if time_since_last_call < self.min_delay:
-            time.sleep(self.min_delay - time_since_last_call)
-        self.last_call_time = time.time()
+    async def _rate_limit(self):
+        """Token bucket rate limiting: bursts up to self.burst calls, refilling one every min_delay"""
+        async with self._rate_lock:
+            current_time = time.time()
+            elapsed = current_time - self.last_call_time
+            self._tokens = min(self.burst, self._tokens + elapsed / self.min_delay)
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) * self.min_delay)
+                self._tokens = 1
+            self._tokens -= 1
+            self.last_call_time = time.time()
+
+    async def prewarm(self):
+        """
+        Open a connection to the provider ahead of the next move request
+        
+        Skipped while a recent request's connection should still be pooled.
+        Best effort, failures are left for the move request to surface.
+        """
+        if time.time() - max(self.last_call_time, self._last_warm) < self.keepalive:
+            return
+        self._last_warm = time.time()
+        try:
+            await self._warm_connection()
+        except Exception as e:
+            log.debug("Prewarming %s failed: %s", type(self).__name__, e)
+
+    async def _warm_connection(self):
+        """Make a cheap request that leaves an open connection in the pool, nothing by default"""
+
+    def cached_reply(self, board_fen: str) -> Optional[ChessMove]:
+        """
+        Get the move this LLM chose when it last saw the position, if reply caching is on
+        
+        Positions are matched on FEN without the move counters, so transpositions
+        and later games reuse the move instead of asking the model again.
+        """
+        key = _position_key(board_fen)
+        move = self._reply_cache.get(key)
+        if move is None:
+            return None
+        self._reply_cache.move_to_end(key)
+        return replace(move, thinking_time=0.0)
+
+    def cache_reply(self, board_fen: str, move: ChessMove):
+        """Remember the move chosen in a position, evicting the least recently used beyond reply_cache_size"""
+        if self.reply_cache_size <= 0:
+            return
+        key = _position_key(board_fen)
+        self._reply_cache[key] = replace(move)
+        self._reply_cache.move_to_end(key)
+        while len(self._reply_cache) > self.reply_cache_size:
+            self._reply_cache.popitem(last=False)
+
+    def _parse_json(self, text: str) -> Any:
+        """Parse a JSON response body, using orjson when it is installed"""
+        if orjson is not None:
+            return orjson.loads(text.encode())
+        return json.loads(text)
+
+    async def _read_stream(self,
+                           deltas: AsyncIterator[str],
+                           legal_set: frozenset[str],
+                           stop_on_illegal: bool) -> Tuple[str, Optional[str]]:
+        """
+        Accumulate a streamed response, stopping as soon as an illegal move is streamed
+        
+        The prompt asks for "move" first, so a bad move can be rejected before
+        the model spends time generating the explanation for it.
+        
+        Args:
+            deltas: Text fragments of the response as they arrive
+            legal_set: Legal moves in san format
+            stop_on_illegal: Abandon the stream when the streamed move is not legal
+        Returns:
+            Tuple of the text received and the illegal move that ended the stream, if any
+        """
+        chunks = []
+        watch_move = stop_on_illegal
+        async for delta in deltas:
+            chunks.append(delta)
+            if watch_move:
+                match = _MOVE_FIELD.search("".join(chunks))
+                if match:
+                    if match.group(1) not in legal_set:
+                        return "".join(chunks), match.group(1)
+                    watch_move = False
+        return "".join(chunks), None
+
+    async def _backoff(self, attempt: int):
+        """Sleep with jittered exponential backoff before retrying a failed API call"""
+        await asyncio.sleep(2 ** attempt + random.random())
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        """Whether a failed API call is worth retrying: no response, timeouts, conflicts, rate limits and server errors"""
+        status = getattr(error, "status_code", None)
+        return status is None or status in (408, 409, 429) or status >= 500
 
     @abstractmethod
     async def get_next_move(self, 
                            board_fen: str, 
                            move_history: list[str],
-                           legal_moves: list[str]) -> ChessMove:
+                           legal_moves: list[str],
+                           legal_set: Optional[frozenset[str]] = None) -> ChessMove:
         """
         Get the next chess move from the LLM.
         
@@ -41,31 +210,72 @@ class BaseLLM(ABC):
             board_fen: Current board position in FEN notation
             move_history: List of previous moves in algebraic notation
             legal_moves: List of legal moves in san format
+            legal_set: Optional prebuilt set of legal_moves for membership checks
         Returns:
             ChessMove object containing the move and explanation
         """
         pass
 
-    def _get_chess_prompt(self, 
-                         board_fen: str, 
-                         move_history: list[str],
-                         legal_moves: list[str]) -> str:
-        """Generate the chess prompt for the LLM"""
-        prompt = (
-            "You are playing a game of chess. Analyze the position and make the best move.\n\n"
-            f"Current position (FEN): {board_fen}\n"
-        )
+    def _render_history(self, move_history: list[str]) -> Tuple[str, ...]:
+        """
+        Render the numbered move list, only formatting moves added since the last call
+        
+        Returns:
+            The list's lines in chunks, earlier chunks are returned unchanged by
+            later calls so requests can share them as a cached prefix
+        """
+        cached = len(self._history_moves)
+        if len(move_history) < cached or move_history[:cached] != self._history_moves:
+            # A different game, start over
+            self._history_moves = []
+            self._history_chunks = []
+            cached = 0
         
+        new_moves = move_history[cached:]
+        if new_moves:
+            self._history_chunks.append("\n".join(f"{i}. {move}" for i, move in enumerate(new_moves, cached + 1)))
+            self._history_moves.extend(new_moves)
+        return tuple(self._history_chunks)
+
+    def _get_chess_prompt_blocks(self,
+                                 board_fen: str,
+                                 move_history: list[str],
+                                 legal_moves: list[str],
+                                 rejected_moves: Optional[list[str]] = None) -> Tuple[Tuple[str, ...], str]:
+        """
+        Generate the chess prompt as stable prefix blocks and a per-position suffix
+        
+        The prefix only grows as moves are played: earlier blocks stay identical
+        across requests and retries and new moves are added as new blocks, so
+        providers can cache it. The suffix carries what changes on every request.
+        
+        Returns:
+            Tuple of (task and move history blocks, position and legal moves),
+            the prefix blocks are joined with newlines
+        """
+        task = "You are playing a game of chess. Analyze the position and make the best move."
         if move_history:
-            prompt += "\nPrevious moves:\n"
-            for i, move in enumerate(move_history, 1):
-                prompt += f"{i}. {move}\n"
-
-        prompt += "\nLegal moves:\n"
-        prompt += ", ".join(legal_moves)
-            
-        prompt += "\n\nRespond with your move in algebraic notation (e.g., 'e4', 'Nf3', etc.)"
-        prompt += "\nand a brief explanation of your thinking."
-        prompt += "\nFormat your response as JSON with keys: 'move', 'explanation', 'confidence' (0-1)"
+            prefix = (f"{task}\n\nPrevious moves:",) + self._render_history(move_history)
+        else:
+            prefix = (task,)
+
+        suffix = [
+            f"Current position (FEN): {board_fen}",
+            "",
+            "Legal moves:",
+            ", ".join(legal_moves),
+        ]
+        if rejected_moves:
+            suffix.append("")
+            suffix.append("These moves are not legal here, do not repeat them: " + ", ".join(rejected_moves))
         
-        return prompt
+        return prefix, "\n".join(suffix)
+
+    def _get_chess_prompt(self, 
+                         board_fen: str, 
+                         move_history: list[str],
+                         legal_moves: list[str],
+                         rejected_moves: Optional[list[str]] = None) -> str:
+        """Generate the chess prompt for the LLM as a single message"""
+        prefix, suffix = self._get_chess_prompt_blocks(board_fen, move_history, legal_moves, rejected_moves)
+        return "\n".join(prefix) + "\n\n" + suffix
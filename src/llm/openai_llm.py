@@ -1,60 +1,111 @@
 import json
+import logging
 from typing import Optional
 import openai
 import time
-from src.llm.base import BaseLLM, ChessMove
+import weakref
+from src.llm.base import BaseLLM, ChessMove, HTTP2_AVAILABLE, for_running_loop
+
+log = logging.getLogger(__name__)
+
+# HTTP client of each event loop, shared by every OpenAILLM so keep-alive
+# connections and their TLS sessions are reused across players and games
+_HTTP_CLIENTS: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
 
 class OpenAILLM(BaseLLM):
     """OpenAI GPT implementation of the LLM interface"""
     
     def __init__(self, api_key: str, model: str = "gpt-4-turbo", temperature: float = 0.7):
         super().__init__(api_key, temperature)
-        self.client = openai.OpenAI(api_key=api_key)
         self.model = model
+        self._clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        """API client of the running event loop, as pooled connections can't move between loops"""
+        http_client = for_running_loop(
+            _HTTP_CLIENTS, lambda: openai.DefaultAsyncHttpxClient(http2=HTTP2_AVAILABLE)
+        )
+        return for_running_loop(
+            self._clients,
+            # Retries are handled by get_next_move
+            lambda: openai.AsyncOpenAI(api_key=self.api_key, http_client=http_client, max_retries=0)
+        )
+
+    async def _warm_connection(self):
+        """List models, a request that costs no tokens, to open a pooled connection"""
+        await self.client.models.list()
 
     async def get_next_move(self, 
                            board_fen: str, 
                            move_history: list[str],
-                           legal_moves: list[str]) -> ChessMove:
+                           legal_moves: list[str],
+                           legal_set: Optional[frozenset[str]] = None) -> ChessMove:
         """Get next move using OpenAI's API"""
-        print("Calling OpenAI API")
-        self._rate_limit()
+        log.debug("Calling OpenAI API")
         
         prompt = self._get_chess_prompt(board_fen, move_history, legal_moves)
+        if legal_set is None:
+            legal_set = frozenset(legal_moves)
+        rejected_moves: list[str] = []
         start_time = time.time()
 
         for i in range(1, self.retries + 1):
         
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a skilled chess engine."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=self.temperature,
-                    response_format={"type": "json_object"}
-                )
-
-                
-                thinking_time = time.time() - start_time
-                
-                try:
-                    result = json.loads(response.choices[0].message.content)
-                    if result["move"] not in legal_moves and i < self.retries:
-                        print(f"Move {result['move']} not in legal moves {legal_moves}, retrying...")
-                        continue
-                    print("Returning move from OpenAI, ", result["move"])
-                    return ChessMove(
-                        move=result["move"],
-                        explanation=result["explanation"],
-                        confidence=float(result["confidence"]),
-                        thinking_time=thinking_time
+                async with self._semaphore:
+                    await self._rate_limit()
+                    stream = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": self.system_prompt},
+                            {"role": "user", "content": prompt}
+                        ],
+                        temperature=self.temperature,
+                        # The static system prompt and history come first so
+                        # OpenAI's automatic prefix caching can reuse them
+                        response_format={"type": "json_object"},
+                        stream=True
                     )
-                except (json.JSONDecodeError, KeyError) as e:
-                    print(f"Invalid response format from OpenAI: {e}")
-                    raise ValueError(f"Invalid response format from OpenAI: {e}")
-                    
+                    try:
+                        text, illegal_move = await self._read_stream(
+                            (chunk.choices[0].delta.content or "" async for chunk in stream if chunk.choices),
+                            legal_set,
+                            stop_on_illegal=i < self.retries
+                        )
+                    finally:
+                        await stream.close()
+            except (openai.APIConnectionError, openai.APIStatusError) as e:
+                # Transient failures, overloaded servers included, are worth waiting out
+                if i < self.retries and self._is_transient(e):
+                    log.warning("Transient error from OpenAI API: %s, backing off...", e)
+                    await self._backoff(i)
+                    continue
+                log.error("Error calling OpenAI API: %s", e)
+                raise Exception(f"Error calling OpenAI API: {str(e)}")
             except Exception as e:
-                print(f"Error calling OpenAI API: {str(e)}")
-                raise Exception(f"Error calling OpenAI API: {str(e)}") 
\ No newline at end of file
+                log.error("Error calling OpenAI API: %s", e)
+                raise Exception(f"Error calling OpenAI API: {str(e)}")
+
+            thinking_time = time.time() - start_time
+            
+            try:
+                # An empty move is illegal too, so test for None rather than truthiness
+                result = None if illegal_move is not None else self._parse_json(text)
+                move = illegal_move if illegal_move is not None else result["move"]
+                if move not in legal_set and i < self.retries:
+                    # Ask again straight away, telling the model which move was rejected
+                    log.info("Move %s not in legal moves %s, retrying...", move, legal_moves)
+                    rejected_moves.append(move)
+                    prompt = self._get_chess_prompt(board_fen, move_history, legal_moves, rejected_moves)
+                    continue
+                log.debug("Returning move from OpenAI: %s", result["move"])
+                return ChessMove(
+                    move=result["move"],
+                    explanation=result["explanation"],
+                    confidence=float(result["confidence"]),
+                    thinking_time=thinking_time
+                )
+            except (json.JSONDecodeError, KeyError) as e:
+                log.error("Invalid response format from OpenAI: %s", e)
+                raise ValueError(f"Invalid response format from OpenAI: {e}")
@@ -0,0 +1,119 @@
+import sys
+import time
+from pathlib import Path
+import asyncio
+
+# Add the project root directory to Python path
+project_root = str(Path(__file__).parent.parent.parent)
+sys.path.append(project_root)
+
+from src.llm.base import BaseLLM, ChessMove
+
+class OfflineLLM(BaseLLM):
+    """LLM that never calls an API, for testing the shared BaseLLM helpers"""
+
+    async def get_next_move(self, board_fen, move_history, legal_moves, legal_set=None):
+        return ChessMove("e4", "", 1.0, 0.0)
+
+async def stream(*chunks):
+    """Yield response fragments, recording how many were read"""
+    for chunk in chunks:
+        stream.read += 1
+        yield chunk
+
+def test_base_llm():
+    """Test the BaseLLM helpers that work without an API"""
+
+    llm = OfflineLLM(api_key="")
+
+    # Test move history rendering
+    print("\nTesting move history rendering...")
+    assert llm._render_history(["e4", "e5"]) == ("1. e4\n2. e5",)
+    assert llm._render_history(["e4", "e5", "Nf3"]) == ("1. e4\n2. e5", "3. Nf3")  # Earlier chunks are kept
+    assert llm._render_history(["e4", "e5", "Nf3"]) == ("1. e4\n2. e5", "3. Nf3")
+    assert llm._render_history(["d4"]) == ("1. d4",)  # A different game starts over
+    assert llm._render_history(["d4", "d5"]) == ("1. d4", "2. d5")
+    assert llm._render_history([]) == ()
+    prompt = llm._get_chess_prompt("fen", ["d4", "d5", "c4"], ["e6"])
+    assert "Previous moves:\n1. d4\n2. d5\n3. c4\n\nCurrent position (FEN): fen" in prompt
+    print("Move history rendering OK!")
+
+    # Test streamed responses
+    print("\nTesting streamed responses...")
+    legal = frozenset(["e4", "Nf3"])
+    stream.read = 0
+    text, illegal = asyncio.run(llm._read_stream(
+        stream('{"move": "e', '4", "explanation": "x"', ', "confidence": 1}'), legal, True
+    ))
+    assert text == '{"move": "e4", "explanation": "x", "confidence": 1}'
+    assert illegal is None
+    assert stream.read == 3
+
+    stream.read = 0
+    text, illegal = asyncio.run(llm._read_stream(
+        stream('{"move": "e5", ', '"explanation": "x"', ', "confidence": 1}'), legal, True
+    ))
+    assert illegal == "e5"
+    assert stream.read == 1  # Abandoned before the explanation
+
+    # An empty move is illegal, not a missing one
+    text, illegal = asyncio.run(llm._read_stream(stream('{"move": "", ', '"explanation": "x"'), legal, True))
+    assert illegal == ""
+
+    text, illegal = asyncio.run(llm._read_stream(stream('{"move": "e5", ', '"confidence": 1}'), legal, False))
+    assert text == '{"move": "e5", "confidence": 1}'
+    assert illegal is None
+    print("Streamed responses OK!")
+
+    # Test rate limiting
+    print("\nTesting rate limiting...")
+    async def calls(n: int) -> float:
+        start = time.time()
+        for _ in range(n):
+            await llm._rate_limit()
+        return time.time() - start
+
+    llm.min_delay = 0.2
+    llm.last_call_time = 0
+    llm._tokens = float(llm.burst)
+    assert asyncio.run(calls(llm.burst)) < 0.1  # A burst goes straight through
+    assert asyncio.run(calls(1)) > 0.1  # The bucket refills one call per min_delay, in any event loop
+    print("Rate limiting OK!")
+
+    # Test which API errors are retried
+    print("\nTesting transient errors...")
+    class StatusError(Exception):
+        def __init__(self, status_code):
+            self.status_code = status_code
+    assert llm._is_transient(ConnectionError())  # No response at all
+    assert all(llm._is_transient(StatusError(code)) for code in (408, 409, 429, 500, 529))
+    assert not any(llm._is_transient(StatusError(code)) for code in (400, 401, 404))
+    print("Transient errors OK!")
+
+    # Test reply caching
+    print("\nTesting reply caching...")
+    start = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+    after_e4 = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+    after_nf3 = "rnbqkbnr/pppppppp/8/8/8/5N2/PPPPPPPP/RNBQKB1R b KQkq - 1 1"
+    llm.cache_reply(start, ChessMove("e4", "Center", 0.9, 1.5))
+    assert llm.cached_reply(start) is None  # Off by default
+
+    llm.reply_cache_size = 2
+    llm.cache_reply(start, ChessMove("e4", "Center", 0.9, 1.5))
+    reply = llm.cached_reply(start.replace(" 0 1", " 4 7"))  # Move counters are ignored
+    assert reply == ChessMove("e4", "Center", 0.9, 0.0)
+    reply.move = "e2e4"
+    assert llm.cached_reply(start).move == "e4"  # Replies are copies
+
+    llm.cache_reply(after_e4, ChessMove("e5", "", 0.5, 1.0))
+    llm.cached_reply(start)  # Now the most recently used
+    llm.cache_reply(after_nf3, ChessMove("d5", "", 0.5, 1.0))
+    assert llm.cached_reply(after_e4) is None  # Least recently used, evicted
+    assert llm.cached_reply(start).move == "e4"
+    assert llm.cached_reply(after_nf3).move == "d5"
+    print("Reply caching OK!")
+
+    print("\nAll tests passed successfully!")
+
+if __name__ == "__main__":
+    test_base_llm()
@@ -1,107 +1,273 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import os
-import sys
 from pathlib import Path
 from dotenv import load_dotenv
 import asyncio
-from typing import Optional
+import logging
+import threading
+from typing import Optional, Tuple
 
-# Add project root to Python path
-project_root = str(Path(__file__).parent.parent.parent)
-sys.path.append(project_root)
-
-from src.llm.openai_llm import OpenAILLM
-from src.llm.anthropic_llm import AnthropicLLM
 from src.controller.game_controller import GameController
-from src.chess_engine.game import ChessGame
-from src.ui.chess_utils import get_chessboard_html, get_move_history_html
+from src.chess_engine.game import ChessGame, GameState
+from src.ui.chess_utils import get_board_update_html, get_move_history_html, get_move_history_delta_html
+
+log = logging.getLogger(__name__)
+
+# Seconds between runs of the game panel on its own while a game is in progress
+PANEL_RUN_EVERY = 0.5
 
-# Load environment variables
-load_dotenv()
+# Chessboard served from src/ui/frontend, so its assets come from the Streamlit server
+chessboard = st.components.v1.declare_component("chessboard", path=str(Path(__file__).parent / "frontend"))
 
 def initialize_session_state():
-    """Initialize session state variables"""
-    if 'game_controller' not in st.session_state:
-        st.session_state.game_controller = None
-    if 'current_game' not in st.session_state:
-        st.session_state.current_game = None
-    if 'game_in_progress' not in st.session_state:
-        st.session_state.game_in_progress = False
-    if 'last_move_count' not in st.session_state:
-        st.session_state.last_move_count = 0
-    if 'game_finished' not in st.session_state:
-        st.session_state.game_finished = False
-    if 'pgn' not in st.session_state:
-        st.session_state.pgn = None
+    """Initialize session state variables, once per session"""
+    if 'initialized' in st.session_state:
+        return
+    
+    # Load environment variables, LOGLEVEL sets the app's log level
+    load_dotenv()
+    logging.basicConfig(level=os.getenv("LOGLEVEL", "WARNING").upper())
+    
+    st.session_state.game_controller = None
+    st.session_state.current_game = None
+    st.session_state.game_in_progress = False
+    st.session_state.last_move_count = 0
+    st.session_state.game_finished = False
+    st.session_state.pgn = None
+    st.session_state.prefetched_move = None
+    st.session_state.rendered_ply_count = 0
+    st.session_state.move_error = None
+    st.session_state.game_number = 0
+    st.session_state.initialized = True
 
-def create_game_controller(white_player: str, black_player: str, 
-                         time_control: Optional[int], max_moves: Optional[int]) -> GameController:
-    """Create a new game controller with specified players"""
+@st.cache_resource
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Start the background event loop shared by every rerun, so API clients keep their connections"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+def cancel_prefetched_move():
+    """Cancel the request already started for the next move, if any"""
+    if st.session_state.prefetched_move is not None:
+        get_event_loop().call_soon_threadsafe(st.session_state.prefetched_move.cancel)
+        st.session_state.prefetched_move = None
+
+def _openai_llm():
+    from src.llm.openai_llm import OpenAILLM
+    return OpenAILLM(api_key=os.getenv("OPENAI_API_KEY"))
+
+def _anthropic_llm():
+    from src.llm.anthropic_llm import AnthropicLLM
+    return AnthropicLLM(api_key=os.getenv("ANTHROPIC_API_KEY"))
+
+@st.cache_resource(show_spinner=False)
+def get_llm(provider: str):
+    """
+    Get the LLM client for a provider, shared across games so its connections are reused
     
-    # Initialize LLMs
+    Provider modules are imported on first use, so an unused provider's SDK is never loaded.
+    """
     players = {
-        'OpenAI': lambda: OpenAILLM(api_key=os.getenv("OPENAI_API_KEY")),
-        'Anthropic': lambda: AnthropicLLM(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        'OpenAI': _openai_llm,
+        'Anthropic': _anthropic_llm
     }
-    
-    white = players[white_player]()
-    black = players[black_player]()
-    
+    return players[provider]()
+
+def create_game_controller(white_player: str, black_player: str, 
+                         time_control: Optional[int], max_moves: Optional[int]) -> GameController:
+    """Create a new game controller with specified players"""
     return GameController(
-        white_player=white,
-        black_player=black,
+        white_player=get_llm(white_player),
+        black_player=get_llm(black_player),
         time_control=time_control,
         max_moves=max_moves
     )
 
+async def _snapshot(game: ChessGame) -> GameState:
+    return game.get_state(copy=True)
+
+def game_snapshot(game: ChessGame) -> GameState:
+    """Copy the game's state on the background event loop, where prefetched moves are played"""
+    return asyncio.run_coroutine_threadsafe(_snapshot(game), get_event_loop()).result()
+
 def display_game_board():
-    """Display the current game state"""
-    if st.session_state.current_game:
-        # Display chessboard
-        st.components.v1.html(
-            get_chessboard_html(
-                fen=st.session_state.current_game.get_fen(),
-                flip=False
-            ),
-            height=650
-        )
+    """Display the current game state, returning the slot that display_new_moves fills"""
+    state = game_snapshot(st.session_state.current_game)
+    
+    # Display chessboard, the mounted component is sent the position at the start of each run
+    chessboard(
+        fen=state.board.fen(),
+        orientation="white",
+        game=st.session_state.game_number,
+        ply=len(state.move_history),
+        key="board"
+    )
+    
+    # Display move history, mounted once per run and then only sent new moves
+    st.components.v1.html(get_move_history_html(), height=400, scrolling=True)
+    update_slot = st.empty()
+    display_new_moves(update_slot, state)
+    return update_slot
+
+def display_new_moves(update_slot, state: GameState, move_board: bool = False):
+    """
+    Send the move history the moves it hasn't been given yet
+    
+    Args:
+        update_slot: Placeholder for the script that delivers new moves
+        state: Snapshot of the game to show
+        move_board: Also move the chessboard to the game's position, for moves
+            played after the board was sent its arguments in this run
+    """
+    moves = state.move_history
+    # A game without moves still clears the moves of the previous one
+    if st.session_state.rendered_ply_count < len(moves) or not moves:
+        script = get_move_history_delta_html(moves, st.session_state.rendered_ply_count)
+        if move_board:
+            script = get_board_update_html(
+                st.session_state.game_number, len(moves), state.board.fen(), moves.ucis[-1] if moves else None
+            ) + script
+        st.session_state.rendered_ply_count = len(moves)
+        with update_slot:
+            st.components.v1.html(script, height=0)
+
+def in_fragment_run() -> bool:
+    """Whether this run is of fragments alone, rather than of the whole app"""
+    return bool(get_script_run_ctx().fragment_ids_this_run)
+
+async def play_single_move(controller: GameController,
+                           prefetched: Optional[asyncio.Task] = None
+                           ) -> Tuple[Optional[GameState], Optional[str], Optional[asyncio.Task]]:
+    """
+    Play a single move in the game
+    
+    Runs on the background event loop, so everything it uses is passed in and
+    the caller updates st.session_state with what it returns. The game is
+    snapshotted before the next move is requested, as that request can play
+    the move while the caller is still showing this one.
+    
+    Args:
+        controller: Controller of the running game
+        prefetched: Request for this move started while the previous move was shown
         
-        # Display move history
-        if st.session_state.current_game.move_history:
-            st.components.v1.html(
-                get_move_history_html(st.session_state.current_game.move_history),
-                height=400, 
-                scrolling=True
-            )
+    Returns:
+        Tuple of the game's state after the move (None if no move was made),
+        the game's PGN once it is over, and the request started for the following move
+    """
+    game = controller.game
+    board = game.board
+    
+    if prefetched is not None:
+        request = prefetched
+    else:
+        # Check for game end conditions
+        if game.is_game_over:
+            return None, await controller.export_game_async(), None
+        
+        color = "white" if board.turn else "black"
+        request = controller._get_next_move(controller._get_current_player(), color)
+        # Open the waiting player's connection while this move is generated
+        controller._prewarm(controller._players[not board.turn])
+    
+    move = await request
+    
+    if not move:
+        return None, await controller.export_game_async(), None
+    
+    state = game.get_state(copy=True)
+    if game.is_game_over:
+        return state, await controller.export_game_async(), None
+    
+    # Ask for the reply straight away so it overlaps with rendering this move
+    next_color = "white" if board.turn else "black"
+    next_move = asyncio.ensure_future(controller._get_next_move(controller._get_current_player(), next_color))
+    controller._prewarm(controller._players[not board.turn])
+    return state, None, next_move
+
+def game_panel():
+    """
+    Board and game, run as a fragment so playing the game reruns only the panel
+    
+    main runs the panel as part of the app, and every PANEL_RUN_EVERY seconds
+    on its own while a game is in progress. The game is only played in those
+    fragment runs, so app reruns can interrupt it.
+    """
+    # Display the game board and move history
+    update_slot = display_game_board()
 
-async def play_single_move():
-    """Play a single move in the game"""
-    if st.session_state.game_controller and not st.session_state.game_finished:
-        try:
-            # Get current player
-            current_player = st.session_state.game_controller._get_current_player()
-            color = "white" if st.session_state.game_controller.game.board.turn else "black"
-
-            # Check for game end conditions
-            if st.session_state.game_controller.game.is_game_over:
-                st.session_state.game_finished = True
-                st.session_state.pgn = st.session_state.game_controller.export_game()
-                return False
+    if st.session_state.move_error:
+        st.error(f"Error during move: {st.session_state.move_error}")
+
+    # Run the game
+    if st.session_state.game_in_progress and not st.session_state.game_finished and in_fragment_run():
+        # Create a placeholder for the progress message
+        status_placeholder = st.empty()
+        controller = st.session_state.game_controller
+        
+        # Play moves until the game ends, showing each one in place rather than rerunning.
+        # The controls rerun the app, which interrupts the loop at its next Streamlit call.
+        pgn = None
+        while pgn is None:
+            with status_placeholder:
+                with st.spinner('Thinking...'):
+                    try:
+                        state, pgn, st.session_state.prefetched_move = asyncio.run_coroutine_threadsafe(
+                            play_single_move(controller, st.session_state.prefetched_move),
+                            get_event_loop()
+                        ).result()
+                    except Exception as e:
+                        st.session_state.move_error = str(e)
+                        st.session_state.prefetched_move = None
+                        state, pgn = None, controller.export_game()
             
-            # Get and validate move
-            move = await st.session_state.game_controller._get_next_move(current_player, color)
-            if move:
-                st.session_state.last_move_count = len(st.session_state.current_game.move_history)
-                return True
-            else:
-                st.session_state.game_finished = True
-                st.session_state.pgn = st.session_state.game_controller.export_game()
-                return False
-                
-        except Exception as e:
-            st.error(f"Error during move: {str(e)}")
-            st.session_state.game_finished = True
-            return False
+            if state is not None:
+                st.session_state.last_move_count = len(state.move_history)
+                display_new_moves(update_slot, state, move_board=True)
+        
+        st.session_state.game_finished = True
+        st.session_state.pgn = pgn
+        # Rerun the app, which updates the controls and stops the panel's own runs
+        st.rerun()
+
+    log.debug("pgn=%s finished=%s", st.session_state.pgn, st.session_state.game_finished)
+    
+    # Display final PGN when game is finished
+    if st.session_state.game_finished and st.session_state.pgn:
+        st.text_area("Game PGN", st.session_state.pgn, height=300)
+
+def display_game_controls():
+    """
+    Stop, Continue and Reset buttons
+    
+    They are outside the game panel, as turning its own runs on and off takes
+    a run of the whole app, which also interrupts a game being played in it.
+    """
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if st.session_state.game_in_progress and not st.session_state.game_finished:
+            if st.button("Stop Game"):
+                st.session_state.game_in_progress = False
+                st.rerun()
+        elif not st.session_state.game_finished:
+            if st.button("Continue Game"):
+                st.session_state.game_in_progress = True
+                st.rerun()
+    
+    with col2:
+        if st.button("Reset Game"):
+            cancel_prefetched_move()
+            st.session_state.game_controller = None
+            st.session_state.current_game = None
+            st.session_state.game_in_progress = False
+            st.session_state.game_finished = False
+            st.session_state.last_move_count = 0
+            st.session_state.rendered_ply_count = 0
+            st.session_state.pgn = None
+            st.session_state.move_error = None
+            st.rerun()
 
 def main():
     st.set_page_config(page_title="LLM Chess Battle", layout="wide")
@@ -142,64 +308,28 @@ def main():
         )
         
         if st.button("Start New Game"):
+            cancel_prefetched_move()
             st.session_state.game_controller = create_game_controller(
                 white_player, black_player, time_control, max_moves
             )
             st.session_state.current_game = st.session_state.game_controller.game
+            st.session_state.game_number += 1
             st.session_state.game_in_progress = True
             st.session_state.game_finished = False
             st.session_state.last_move_count = 0
+            st.session_state.rendered_ply_count = 0
             st.session_state.pgn = None
+            st.session_state.move_error = None
+        
+        if st.session_state.current_game:
+            display_game_controls()
     
     # Main content area
     if not st.session_state.current_game:
         st.info("Configure and start a new game using the sidebar controls.")
     else:
-        # Display the game board and move history
-        display_game_board()
-        
-        # Game controls
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if st.session_state.game_in_progress and not st.session_state.game_finished:
-                if st.button("Stop Game"):
-                    st.session_state.game_in_progress = False
-            elif not st.session_state.game_finished:
-                if st.button("Continue Game"):
-                    st.session_state.game_in_progress = True
-        
-        with col2:
-            if st.button("Reset Game"):
-                st.session_state.game_controller = None
-                st.session_state.current_game = None
-                st.session_state.game_in_progress = False
-                st.session_state.game_finished = False
-                st.session_state.last_move_count = 0
-                st.session_state.pgn = None
-                st.rerun()
-
-        # Run the game
-        if st.session_state.game_in_progress and not st.session_state.game_finished:
-            # Create a placeholder for the progress message
-            status_placeholder = st.empty()
-            
-            # Play a single move
-            with status_placeholder:
-                with st.spinner('Thinking...'):
-                    move_made = asyncio.run(play_single_move())
-                    
-                    if move_made:
-                        st.rerun()
-                    else:
-                        st.session_state.game_finished = True
-
-        print("st.session_state.pgn", st.session_state.pgn)
-        print("st.session_state.game_finished", st.session_state.game_finished)
-        
-        # Display final PGN when game is finished
-        if st.session_state.game_finished and st.session_state.pgn:
-            st.text_area("Game PGN", st.session_state.pgn, height=300)
+        playing = st.session_state.game_in_progress and not st.session_state.game_finished
+        st.fragment(game_panel, run_every=PANEL_RUN_EVERY if playing else None)()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,95 +1,54 @@
+import functools
+import json
 from typing import Optional
 
-def get_chessboard_html(fen: Optional[str] = None, flip: bool = False) -> str:
-    """Generate HTML for an interactive chessboard using chessboard.js"""
-    
-    # Default FEN for starting position if none provided
-    fen = fen or "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+from src.chess_engine.game import MoveHistory
+
+def get_board_update_html(game: int, ply: int, fen: str, last_move: Optional[str] = None) -> str:
+    """
+    Generate a script moving the mounted chessboard component to a new position
     
+    Args:
+        game: Number of the game, whose positions replace any of an earlier game
+        ply: Number of moves played to reach the position, older positions are ignored
+        fen: Position to show
+        last_move: Move that led to it in uci format, animated as a single piece move
+    """
     return f"""
-        <div id="board-container" style="width: 600px; margin: auto;">
-            <div id="board"></div>
-        </div>
-        
-        <link
-            rel="stylesheet"
-            href="https://unpkg.com/@chrisoakman/chessboardjs@1.0.0/dist/chessboard-1.0.0.min.css"
-            integrity="sha384-q94+BZtLrkL1/ohfjR8c6L+A6qzNH9R2hBLwyoAfu3i/WCvQjzL2RQJ3uNHDISdU"
-            crossorigin="anonymous"
-        />
-        <script
-            src="https://code.jquery.com/jquery-3.7.1.min.js"
-            integrity="sha384-1H217gwSVyLSIfaLxHbE7dRb3v4mYCKbpQvzx0cegeju1MVsGrX5xXxAvs/HgeFs"
-            crossorigin="anonymous"
-        ></script>
-        <script
-            src="https://unpkg.com/@chrisoakman/chessboardjs@1.0.0/dist/chessboard-1.0.0.min.js"
-            integrity="sha384-8Vi8VHwn3vjQ9eUHUxex3JSN/NFqUg3QbPyX8kWyb93+8AC/pPWTzj+nHtbC5bxD"
-            crossorigin="anonymous"
-        ></script>
-        
         <script>
-            // Initialize the board with current position
-            var board = Chessboard('board', {{
-                position: '{fen}',
-                orientation: '{("white", "black")[flip]}',
-                showNotation: true,
-                pieceTheme: 'https://lichess1.org/assets/piece/cburnett/{{piece}}.svg'
-            }});
-            
-            // Make the board responsive
-            $(window).resize(function() {{
-                board.resize();
-            }});
+            window.parent.__chessboardPosition && window.parent.__chessboardPosition(
+                {game}, {ply}, {json.dumps(fen)}, {json.dumps(last_move or "")}
+            );
         </script>
-        
-        <style>
-            #board-container {{
-                padding: 20px;
-                background: #f0f0f0;
-                border-radius: 10px;
-                box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
-            }}
-        </style>
     """
 
-def get_move_history_html(moves: list[tuple[str, str, str]]) -> str:
-    """Generate HTML for move history display"""
-    
-    html = """
-        <div class="move-history">
-            <table style="width: 100%;">
-                <thead>
-                    <tr>
-                        <th>Move</th>
-                        <th>White</th>
-                        <th>Black</th>
-                    </tr>
-                </thead>
-                <tbody>
-    """
-    
-    rows = []
-    for i in range(0, len(moves), 2):
-        move_num = i // 2 + 1
-        white_move = f"{moves[i][1]}<br/><small>{moves[i][2]}</small>" if i < len(moves) else ""
-        black_move = f"{moves[i+1][1]}<br/><small>{moves[i+1][2]}</small>" if i+1 < len(moves) else ""
-        
-        rows.append(f"""
-            <tr>
-                <td>{move_num}.</td>
-                <td>{white_move}</td>
-                <td>{black_move}</td>
-            </tr>
-        """)
+# Script and styles of the move history table
+_HISTORY_SCRIPT = """
+        <script>
+            // Moves are stored on the parent window by get_move_history_delta_html,
+            // which survives this frame being remounted, add the ones not shown yet
+            var moveHistory = window.parent.__moveHistory = window.parent.__moveHistory || {plies: []};
+            var tbody = document.querySelector('.move-history tbody');
+            var shown = 0;
+            moveHistory.render = function(reset) {
+                if (reset) {
+                    tbody.innerHTML = '';
+                    shown = 0;
+                }
+                for (; shown < moveHistory.plies.length; shown++) {
+                    var cell = '<td>' + moveHistory.plies[shown] + '</td>';
+                    if (shown % 2 === 0) {
+                        tbody.insertAdjacentHTML('beforeend', '<tr><td>' + (shown / 2 + 1) + '.</td>' + cell + '<td></td></tr>');
+                    } else {
+                        tbody.lastElementChild.lastElementChild.outerHTML = cell;
+                    }
+                }
+            };
+            moveHistory.render(false);
+        </script>
+"""
 
-    html += "".join(reversed(rows))
-    
-    html += """
-                </tbody>
-            </table>
-        </div>
-        
+_HISTORY_CSS = """
         <style>
             .move-history {
                 margin: 20px;
@@ -101,6 +60,19 @@ def get_move_history_html(moves: list[tuple[str, str, str]]) -> str:
             .move-history table {
                 border-collapse: collapse;
             }
+            /* Rows are in move order, show the latest move first */
+            .move-history tbody {
+                display: flex;
+                flex-direction: column-reverse;
+            }
+            .move-history tr {
+                display: table;
+                table-layout: fixed;
+                width: 100%;
+            }
+            .move-history th:first-child, .move-history td:first-child {
+                width: 3em;
+            }
             .move-history th, .move-history td {
                 padding: 8px;
                 text-align: left;
@@ -111,6 +83,54 @@ def get_move_history_html(moves: list[tuple[str, str, str]]) -> str:
                 font-size: 0.85em;
             }
         </style>
+"""
+
+def _move_cell(san: str, comment: str) -> str:
+    """Generate the HTML for one move and its explanation"""
+    return f"{san}<br/><small>{comment}</small>"
+
+@functools.lru_cache(maxsize=1)
+def get_move_history_html() -> str:
     """
+    Generate HTML for the move history display
     
-    return html 
\ No newline at end of file
+    The table starts empty and get_move_history_delta_html scripts add the moves,
+    so it is the same for every game and only built once per process.
+    """
+    html = """
+        <div class="move-history">
+            <table style="width: 100%;">
+                <thead>
+                    <tr>
+                        <th>Move</th>
+                        <th>White</th>
+                        <th>Black</th>
+                    </tr>
+                </thead>
+                <tbody>
+                </tbody>
+            </table>
+        </div>
+    """
+    
+    return html + _HISTORY_SCRIPT + _HISTORY_CSS
+
+def get_move_history_delta_html(moves: MoveHistory, start_ply: int) -> str:
+    """
+    Generate a script adding moves from start_ply on to the mounted move history
+    
+    Starting from ply 0 replaces the moves of any earlier game.
+    """
+    # Escape "</" so a comment can't close the script element
+    cells = json.dumps(
+        list(map(_move_cell, moves.sans[start_ply:], moves.comments[start_ply:]))
+    ).replace("</", "<\\/")
+    
+    return f"""
+        <script>
+            var moveHistory = window.parent.__moveHistory = window.parent.__moveHistory || {{plies: []}};
+            moveHistory.plies.length = {start_ply};
+            moveHistory.plies.push.apply(moveHistory.plies, {cells});
+            moveHistory.render && moveHistory.render({start_ply} === 0);
+        </script>
+    """